@@ -1,6 +1,6 @@
 
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from pydantic import BaseModel
 from typing import List, Optional
 import fastapi
@@ -10,7 +10,18 @@ import openai
 import httpx
 import json
 import os
+import time
 import uuid
+import threading
+import copy
+from datetime import date
+from change_feed import ChangeFeed
+from tiered_store import ColdStore, hot_cutoff, memory_date
+from record_cache import EncodedRecordCache, dumps, encode_results
+from jobs import JobRunner
+from local_index import open_index
+from query_helper import get_openai_client
+from sync_index import EMBED_BATCH_SIZE, build_metadata, embed_texts, load_cursor, sync_once
 
 try:
     import pinecone
@@ -29,10 +40,134 @@ if os.path.exists(CACHE_FILE):
 else:
     memory_cache = {"memories": [], "vocab": []}
 
+# Background jobs mutate the cache alongside request handlers
+memory_lock = threading.RLock()
+
 
 def save_cache():
-    with open(CACHE_FILE, "w") as f:
+    with open(CACHE_FILE + ".tmp", "w") as f:
         json.dump(memory_cache, f, indent=2)
+    os.replace(CACHE_FILE + ".tmp", CACHE_FILE)
+
+
+# --- Change Feed (consumed by sync_index.py) ---
+change_feed = ChangeFeed(writer=True)
+
+
+# --- Encoded Records (serialized once, reused by every response until updated) ---
+record_cache = EncodedRecordCache()
+
+
+def json_response(body):
+    return Response(content=body, media_type="application/json")
+
+
+# --- Cold Tier (memories past HOT_HORIZON_DAYS live in compressed segments) ---
+SEAL_INTERVAL_SECONDS = int(os.getenv("SEAL_INTERVAL_SECONDS", "3600"))
+
+cold_store = ColdStore()
+cold_store.reconcile({mem["id"] for mem in memory_cache["memories"]})
+
+
+# Serializes seal passes (the periodic sealer and compaction jobs)
+seal_lock = threading.Lock()
+
+
+def seal_cold_memories():
+    # Segments are written outside memory_lock so requests are not stalled.
+    # They are built from copies, as updates edit hot records in place, and a
+    # record only moves if it is still unchanged when the hot tier is rewritten.
+    cutoff = hot_cutoff()
+    with seal_lock:
+        with memory_lock:
+            aged = [copy.deepcopy(mem) for mem in memory_cache["memories"] if memory_date(mem) < cutoff]
+        staged = cold_store.stage_seal(aged)
+        if not staged:
+            return
+
+        with memory_lock:
+            current = {mem["id"]: mem for mem in memory_cache["memories"]}
+            sealed = {mem["id"] for mem in aged if current.get(mem["id"]) == mem}
+            memory_cache["memories"] = [mem for mem in memory_cache["memories"] if mem["id"] not in sealed]
+            for memory_id in sealed:
+                record_cache.invalidate(memory_id)
+            save_cache()
+            cold_store.commit_seal(staged, sealed)
+
+
+def seal_periodically():
+    # Keeps RAM bounded by the hot set: memories age past the horizon, and
+    # updated cold memories come back to the hot tier until the next pass
+    while True:
+        time.sleep(SEAL_INTERVAL_SECONDS)
+        try:
+            seal_cold_memories()
+        except Exception as e:
+            print(f"⚠️ Sealing cold memories failed: {e}")
+
+
+seal_cold_memories()
+threading.Thread(target=seal_periodically, name="sealer", daemon=True).start()
+
+
+def find_memory(memory_id):
+    """Return (memory, segment name); the segment is set when the memory is still sealed."""
+    for mem in memory_cache["memories"]:
+        if mem["id"] == memory_id:
+            return mem, None
+    return cold_store.locate(memory_id)
+
+
+def memory_snapshot():
+    """Return a consistent (hot list, ColdSnapshot) pair; close the snapshot when done."""
+    with memory_lock:
+        return list(memory_cache["memories"]), cold_store.snapshot()
+
+
+def iter_snapshot(hot, cold, after=None):
+    """Yield (cursor, memory) over both tiers in a stable order; resume by passing the last cursor.
+
+    Cursors only carry over between snapshots with the same cold.generation.
+    """
+    for mem in sorted(hot, key=lambda m: m["id"]):
+        cursor = [0, mem["id"], 0]
+        if after is None or cursor > after:
+            yield cursor, mem
+    for name, offset, mem in cold.iter_records():
+        cursor = [1, name, offset]
+        if after is None or cursor > after:
+            yield cursor, mem
+
+
+def memory_matches(mem, req):
+    """Apply the SearchRequest filters to a single memory."""
+    if req.query and req.query.lower() not in mem["text"].lower():
+        return False
+    if req.kinds and mem["kind"] not in req.kinds:
+        return False
+
+    day = memory_date(mem)
+    if req.date and day != req.date:
+        return False
+    if req.date_from and day < req.date_from:
+        return False
+    if req.date_to and day > req.date_to:
+        return False
+
+    tags = mem.get("tags") or []
+    if req.tags_contains and not all(t in tags for t in req.tags_contains):
+        return False
+    if req.tags_contains_all and not all(t in tags for t in req.tags_contains_all):
+        return False
+    if req.tags_contains_any and not any(t in tags for t in req.tags_contains_any):
+        return False
+    if req.people_contains_any and not any(p in (mem.get("people") or []) for p in req.people_contains_any):
+        return False
+    if req.mood_contains_any and mem.get("mood") not in req.mood_contains_any:
+        return False
+    if req.activities_contains_any and not any(a in (mem.get("activities") or []) for a in req.activities_contains_any):
+        return False
+    return True
 
 
 # --- Models ---
@@ -89,77 +224,319 @@ class VocabularyRequest(BaseModel):
     words: List[str]
 
 
+class JobRequest(BaseModel):
+    kind: str  # reindex, reembed, export, compaction
+    params: Optional[dict] = {}
+
+
+class JobIdRequest(BaseModel):
+    id: str
+
+
+# --- Background Jobs ---
+EXPORT_DIR = "exports"
+
+
+def resume_point(ctx, cold):
+    """Return the job's checkpoint if it still applies to this snapshot, else start over."""
+    checkpoint = ctx.checkpoint
+    if checkpoint and checkpoint.get("generation") != cold.generation:
+        # Records moved between or within tiers since then, so the cursor is meaningless
+        ctx.reset()
+        return None
+    return checkpoint
+
+
+def reindex_job(ctx, batch_size=EMBED_BATCH_SIZE):
+    """Re-embed and upsert every memory in both tiers."""
+    index = open_index("core-memory")
+    client = get_openai_client()
+    hot, cold = memory_snapshot()
+
+    with cold:
+        checkpoint = resume_point(ctx, cold)
+        ctx.set_total(len(hot) + cold.count)
+
+        def flush(batch):
+            embeddings = embed_texts(client, [mem["text"] for _, mem in batch])
+            index.upsert(vectors=[
+                {"id": mem["id"], "values": emb, "metadata": build_metadata(mem)}
+                for (_, mem), emb in zip(batch, embeddings)
+            ])
+            ctx.advance(len(batch), checkpoint={"cursor": batch[-1][0], "generation": cold.generation})
+
+        batch = []
+        for cursor, mem in iter_snapshot(hot, cold, checkpoint and checkpoint["cursor"]):
+            batch.append((cursor, mem))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    return {"indexed": ctx.job.done}
+
+
+def reembed_job(ctx):
+    """Run sync_index against the change feed; its acknowledged cursor is the checkpoint."""
+    ctx.set_total(ctx.job.done + max(change_feed.last_seq - load_cursor()["seq"], 0))
+    return sync_once(feed=change_feed, on_pass=lambda n, seq: ctx.advance(n, checkpoint=seq))
+
+
+def export_job(ctx, filename="memories_export.jsonl", date_from=None, batch_size=500):
+    """Write memories (optionally only those on/after date_from) to EXPORT_DIR/filename."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    path = os.path.join(EXPORT_DIR, filename)
+    hot, cold = memory_snapshot()
+
+    with cold:
+        checkpoint = resume_point(ctx, cold)
+        if checkpoint and not os.path.exists(path):
+            ctx.reset()
+            checkpoint = None
+        ctx.set_total(len(hot) + cold.count)
+        exported = checkpoint["exported"] if checkpoint else 0
+
+        with open(path, "r+b" if checkpoint else "wb") as f:
+            if checkpoint:
+                # Drop anything written after the checkpoint, including a torn last line
+                f.truncate(checkpoint["offset"])
+                f.seek(checkpoint["offset"])
+
+            def save_progress(scanned, cursor):
+                f.flush()
+                ctx.advance(scanned, checkpoint={
+                    "cursor": cursor,
+                    "offset": f.tell(),
+                    "exported": exported,
+                    "generation": cold.generation,
+                })
+
+            scanned, last = 0, None
+            for cursor, mem in iter_snapshot(hot, cold, checkpoint and checkpoint["cursor"]):
+                if not date_from or memory_date(mem) >= date_from:
+                    f.write(dumps(mem) + b"\n")
+                    exported += 1
+                scanned, last = scanned + 1, cursor
+                if scanned >= batch_size:
+                    save_progress(scanned, last)
+                    scanned = 0
+            if scanned:
+                save_progress(scanned, last)
+    return {"path": path, "exported": exported}
+
+
+def compaction_job(ctx):
+    """Seal memories that aged past the hot horizon, then compact segments one month at a time."""
+    # Compacted months drop out of the plan, so a resumed job just plans again
+    ctx.reset()
+    seal_cold_memories()
+    groups = cold_store.plan_compaction()
+    ctx.set_total(1 + len(groups))
+    ctx.advance(1)
+
+    rewritten = 0
+    for names in groups:
+        rewritten += cold_store.compact_segments(names)
+        ctx.advance(1)
+    return dict(cold_store.stats(), segments_rewritten=rewritten)
+
+
+def _check_batch_size(params, limit):
+    value = params.get("batch_size", 1)
+    if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= limit:
+        raise ValueError(f"batch_size must be an integer between 1 and {limit}")
+
+
+def validate_reindex_params(params):
+    # The embeddings API accepts at most 2048 inputs per request
+    _check_batch_size(params, 2048)
+
+
+def validate_export_params(params):
+    _check_batch_size(params, 10000)
+    filename = params.get("filename", "memories_export.jsonl")
+    if (not isinstance(filename, str) or os.path.basename(filename) != filename
+            or filename.startswith(".") or not filename.endswith(".jsonl")):
+        raise ValueError(f"filename must be a plain .jsonl file name inside {EXPORT_DIR}/")
+    date_from = params.get("date_from")
+    if date_from is not None:
+        try:
+            date.fromisoformat(date_from)
+        except (TypeError, ValueError):
+            raise ValueError("date_from must be a YYYY-MM-DD date")
+
+
+job_runner = JobRunner()
+job_runner.register("reindex", reindex_job, params=("batch_size",),
+                    validate=validate_reindex_params, conflicts=("compaction",))
+job_runner.register("reembed", reembed_job)
+job_runner.register("export", export_job, params=("filename", "date_from", "batch_size"),
+                    validate=validate_export_params, conflicts=("compaction",))
+job_runner.register("compaction", compaction_job)
+
+
+@app.middleware("http")
+async def track_foreground_latency(request, call_next):
+    # Jobs back off while this average is over FOREGROUND_LATENCY_BUDGET_MS
+    started = time.perf_counter()
+    response = await call_next(request)
+    job_runner.monitor.record((time.perf_counter() - started) * 1000)
+    return response
+
+
 # --- Endpoints ---
 @app.post("/storeMemory")
-def store_memory(req: MemoryRequest):
+def store_memory(req: MemoryRequest, ids_only: bool = False):
     entry_id = req.id or str(uuid.uuid4())
     entry = req.dict()
     entry["id"] = entry_id
 
-    memory_cache["memories"].append(entry)
-    save_cache()
+    with memory_lock:
+        if find_memory(entry_id)[0] is not None:
+            return {"status": "error", "message": "Memory id already exists"}
+        memory_cache["memories"].append(entry)
+        record_cache.invalidate(entry_id)
+        change_feed.append("store", entry_id, entry, text_changed=True)
+        save_cache()
 
-    return {"status": "ok", "id": entry_id, "stored": entry}
+    if ids_only:
+        return {"status": "ok", "id": entry_id}
+    return json_response(
+        b'{"status":"ok","id":' + dumps(entry_id) + b',"stored":' + record_cache.get(entry) + b"}"
+    )
 
 
 @app.post("/searchMemories")
 def search_memories(req: SearchRequest):
+    # (memory, encoded) pairs: hot records are encoded through the cache, cold
+    # records keep the JSON bytes they were stored with
     results = []
 
-    for mem in memory_cache["memories"]:
-        if req.query and req.query.lower() not in mem["text"].lower():
-            continue
-        if req.kinds and mem["kind"] not in req.kinds:
-            continue
-        results.append(mem)
+    hot, cold = memory_snapshot()
+    for mem in hot:
+        if memory_matches(mem, req):
+            results.append((mem, None))
+
+    # Only segments whose date range and facet blooms can match are opened
+    with cold:
+        for mem, raw in cold.scan(req):
+            if memory_matches(mem, req):
+                results.append((mem, raw))
 
     # Sort
     if req.sort_by == "newest":
-        results.sort(key=lambda x: x["meta"]["datetime_iso"], reverse=True)
+        results.sort(key=lambda x: x[0]["meta"]["datetime_iso"], reverse=True)
     elif req.sort_by == "oldest":
-        results.sort(key=lambda x: x["meta"]["datetime_iso"])
+        results.sort(key=lambda x: x[0]["meta"]["datetime_iso"])
 
-    return {"results": results}
+    # Records are concatenated as pre-encoded bytes, skipping response-model validation
+    return json_response(encode_results(
+        [record_cache.get(mem) if encoded is None else encoded for mem, encoded in results]
+    ))
 
 
 @app.post("/updateMemory")
-def update_memory(req: UpdateRequest):
-    for mem in memory_cache["memories"]:
-        if mem["id"] == req.id:
-            if req.text is not None:
-                mem["text"] = req.text
-            if req.tags is not None:
-                mem["tags"] = req.tags
-            if req.mood is not None:
-                mem["mood"] = req.mood
-            if req.people is not None:
-                mem["people"] = req.people
-            if req.activities is not None:
-                mem["activities"] = req.activities
-            if req.keywords is not None:
-                mem["keywords"] = req.keywords
-            save_cache()
-            return {"status": "ok", "updated": mem}
-    return {"status": "error", "message": "Memory not found"}
+def update_memory(req: UpdateRequest, ids_only: bool = False):
+    with memory_lock:
+        mem, segment = find_memory(req.id)
+        if mem is None:
+            return {"status": "error", "message": "Memory not found"}
+
+        text_changed = req.text is not None and req.text != mem["text"]
+        if req.text is not None:
+            mem["text"] = req.text
+        if req.tags is not None:
+            mem["tags"] = req.tags
+        if req.mood is not None:
+            mem["mood"] = req.mood
+        if req.people is not None:
+            mem["people"] = req.people
+        if req.activities is not None:
+            mem["activities"] = req.activities
+        if req.keywords is not None:
+            mem["keywords"] = req.keywords
+        record_cache.invalidate(mem["id"])
+        change_feed.append("update", mem["id"], mem, text_changed=text_changed)
+        if segment:
+            # A sealed memory moves back to the hot tier; its cold copy is only
+            # tombstoned once the hot copy is on disk
+            memory_cache["memories"].append(mem)
+        save_cache()
+        if segment:
+            cold_store.tombstone(segment, mem["id"])
+
+    if ids_only:
+        return {"status": "ok", "id": mem["id"]}
+    return json_response(b'{"status":"ok","updated":' + record_cache.get(mem) + b"}")
 
 
 @app.post("/deleteMemory")
 def delete_memory(req: DeleteRequest):
-    for mem in memory_cache["memories"]:
-        if mem["id"] == req.id:
+    with memory_lock:
+        mem, segment = find_memory(req.id)
+        if mem is None:
+            return {"status": "error", "message": "Memory not found"}
+
+        record_cache.invalidate(req.id)
+        change_feed.append("delete", req.id)
+        if segment:
+            cold_store.tombstone(segment, req.id)
+        else:
             memory_cache["memories"].remove(mem)
             save_cache()
-            return {"status": "ok", "deleted_id": req.id}
-    return {"status": "error", "message": "Memory not found"}
+    return {"status": "ok", "deleted_id": req.id}
 
 
 @app.post("/storeVocabulary")
 def store_vocabulary(req: VocabularyRequest):
-    memory_cache["vocab"].extend(req.words)
-    save_cache()
+    with memory_lock:
+        memory_cache["vocab"].extend(req.words)
+        change_feed.append("vocab", None, {"words": req.words})
+        save_cache()
     return {"status": "ok", "vocab_size": len(memory_cache["vocab"])}
 
 
+@app.post("/submitJob")
+def submit_job(req: JobRequest):
+    try:
+        job = job_runner.submit(req.kind, req.params)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "ok", "job": job.to_dict()}
+
+
+@app.get("/jobStatus")
+def job_status(id: str):
+    job = job_runner.jobs.get(id)
+    if job is None:
+        return {"status": "error", "message": "Job not found"}
+    return {"status": "ok", "job": job.to_dict()}
+
+
+@app.get("/listJobs")
+def list_jobs():
+    jobs = sorted(job_runner.jobs.values(), key=lambda j: j.created_at, reverse=True)
+    return {"status": "ok", "jobs": [job.to_dict() for job in jobs]}
+
+
+@app.post("/cancelJob")
+def cancel_job(req: JobIdRequest):
+    if req.id not in job_runner.jobs:
+        return {"status": "error", "message": "Job not found"}
+    return {"status": "ok", "job": job_runner.cancel(req.id).to_dict()}
+
+
+@app.post("/resumeJob")
+def resume_job(req: JobIdRequest):
+    if req.id not in job_runner.jobs:
+        return {"status": "error", "message": "Job not found"}
+    try:
+        job = job_runner.resume(req.id)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "ok", "job": job.to_dict()}
+
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
@@ -0,0 +1,147 @@
+import os
+import json
+import threading
+
+# Append-only log of every mutation made through the API. Each line is one
+# change with a monotonically increasing sequence number, so consumers such as
+# sync_index.py can resume from the last position (segment and byte offset)
+# they acknowledged.
+#
+# The log is split into segment files under CHANGE_FEED_DIR, each named after
+# the first sequence number it holds. The writer rolls over to a new segment
+# once the current one passes CHANGE_FEED_SEGMENT_BYTES, and the consumer
+# deletes segments it has fully acknowledged (trim), so disk use and startup
+# recovery follow the unacknowledged backlog rather than total mutations.
+#
+# A line without its trailing newline is an append still in progress, or one
+# torn by a crash. Readers never consume it; only the writing process (the API)
+# truncates it, at startup, before appending anything new.
+CHANGE_FEED_DIR = "memory_changes"
+CHANGE_FEED_SEGMENT_BYTES = int(os.getenv("CHANGE_FEED_SEGMENT_BYTES", str(8 * 1024 * 1024)))
+
+
+class ChangeFeed:
+    def __init__(self, directory=CHANGE_FEED_DIR, writer=False, segment_bytes=CHANGE_FEED_SEGMENT_BYTES):
+        self.directory = directory
+        self.writer = writer
+        self.segment_bytes = segment_bytes
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        if writer:
+            os.makedirs(directory, exist_ok=True)
+            self.last_seq = self._recover()
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:012d}.jsonl")
+
+    def segments(self):
+        """First sequence numbers of the segment files on disk, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[:-6]) for name in os.listdir(self.directory)
+                      if name.endswith(".jsonl") and name[:-6].isdigit())
+
+    def _recover(self):
+        """Return the last sequence number, truncating a torn final line left by a crash.
+
+        Only the newest segment can hold the tail, so that is all that is read.
+        """
+        segments = self.segments()
+        if not segments:
+            return 0
+
+        path = self._path(segments[-1])
+        last, good_end = segments[-1] - 1, 0
+        with open(path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                if line.strip():
+                    try:
+                        last = json.loads(line)["seq"]
+                    except ValueError:
+                        break
+                good_end += len(line)
+
+        if good_end < os.path.getsize(path):
+            print(f"⚠️ Truncating torn change feed tail in {path}")
+            with open(path, "r+b") as f:
+                f.truncate(good_end)
+        return last
+
+    def append(self, op, entry_id, entry=None, text_changed=False):
+        """Durably record one mutation and return its sequence number.
+
+        op is "store", "update", "delete" or "vocab". entry is the record as it
+        looks after the change (None for deletes).
+        """
+        if not self.writer:
+            raise RuntimeError("ChangeFeed was opened read-only")
+
+        with self._lock:
+            seq = self.last_seq + 1
+            change = {
+                "seq": seq,
+                "op": op,
+                "id": entry_id,
+                "text_changed": text_changed,
+                "entry": entry,
+            }
+            segments = self.segments()
+            path = self._path(segments[-1]) if segments else None
+            if path is None or os.path.getsize(path) >= self.segment_bytes:
+                path = self._path(seq)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(change, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.last_seq = seq
+            return seq
+
+    def read_from(self, segment, offset, limit=None):
+        """Return (changes, segment, offset) for complete lines after the given position.
+
+        The returned position is where the next unread line starts. A position in
+        a segment that no longer exists (e.g. a fresh cursor) starts at the oldest
+        segment after it. Lines that are not valid JSON are skipped.
+        """
+        changes = []
+        segments = [s for s in self.segments() if s >= segment]
+        if segments and segments[0] != segment:
+            segment, offset = segments[0], 0
+
+        for i, current in enumerate(segments):
+            if current != segment:
+                segment, offset = current, 0
+            with open(self._path(segment), "rb") as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    if not line.strip():
+                        continue
+                    try:
+                        changes.append(json.loads(line))
+                    except ValueError:
+                        print(f"⚠️ Skipping unreadable change feed line in segment {segment}")
+                        continue
+                    if limit and len(changes) >= limit:
+                        return changes, segment, offset
+            # Only a complete (rolled-over) segment may be left for the next one
+            if i + 1 < len(segments) and offset < os.path.getsize(self._path(segment)):
+                break
+        return changes, segment, offset
+
+    def trim(self, segment):
+        """Delete segments older than the given one, i.e. everything already acknowledged."""
+        removed = 0
+        for older in self.segments():
+            if older >= segment:
+                break
+            try:
+                os.remove(self._path(older))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
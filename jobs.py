@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# In-process runner for long maintenance work (re-index, re-embed, export,
+# compaction). Jobs run on a small bounded pool, persist their progress and
+# checkpoint under JOB_STATE_DIR, and back off whenever foreground request
+# latency goes over FOREGROUND_LATENCY_BUDGET_MS.
+JOB_STATE_DIR = "jobs"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+FOREGROUND_LATENCY_BUDGET_MS = float(os.getenv("FOREGROUND_LATENCY_BUDGET_MS", "250"))
+JOB_BATCH_PAUSE_MS = float(os.getenv("JOB_BATCH_PAUSE_MS", "10"))
+# Upper bound on one back-off, so a job always makes progress eventually
+JOB_MAX_BACKOFF_SECONDS = float(os.getenv("JOB_MAX_BACKOFF_SECONDS", "30"))
+
+RESUMABLE_STATES = ("cancelled", "failed", "interrupted")
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class LatencyMonitor:
+    """Tracks an exponentially weighted average of foreground request latency.
+
+    The average also halves every half_life_s without traffic, so one slow
+    request followed by silence does not hold jobs back forever.
+    """
+
+    def __init__(self, budget_ms=FOREGROUND_LATENCY_BUDGET_MS, alpha=0.2, half_life_s=2.0):
+        self.budget_ms = budget_ms
+        self.alpha = alpha
+        self.half_life_s = half_life_s
+        self.average_ms = 0.0
+        self._last_sample = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decayed(self, now):
+        return self.average_ms * 0.5 ** ((now - self._last_sample) / self.half_life_s)
+
+    def record(self, latency_ms):
+        with self._lock:
+            now = time.monotonic()
+            average = self._decayed(now)
+            self.average_ms = average + self.alpha * (latency_ms - average)
+            self._last_sample = now
+
+    def current_ms(self):
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+    def over_budget(self):
+        return self.current_ms() > self.budget_ms
+
+
+class Job:
+    def __init__(self, kind, params=None, job_id=None):
+        self.id = job_id or str(uuid.uuid4())
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"
+        self.total = None
+        self.done = 0
+        self.checkpoint = None
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.throttled_seconds = 0.0
+        self.cancel_event = threading.Event()
+        # Throughput is measured over the current run only, so resumes are not skewed
+        self._run_started = None
+        self._run_done_start = 0
+
+    def to_dict(self):
+        throughput = None
+        eta_seconds = None
+        if self.status == "running" and self._run_started:
+            elapsed = time.time() - self._run_started
+            if elapsed > 0:
+                throughput = (self.done - self._run_done_start) / elapsed
+            if throughput and self.total is not None:
+                eta_seconds = max(self.total - self.done, 0) / throughput
+
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "progress": (self.done / self.total) if self.total else None,
+            "throughput_per_sec": throughput,
+            "eta_seconds": eta_seconds,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "checkpoint": self.checkpoint,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        job = cls(d["kind"], d["params"], job_id=d["id"])
+        for key in ("status", "total", "done", "checkpoint", "result", "error",
+                    "created_at", "updated_at", "throttled_seconds"):
+            setattr(job, key, d[key])
+        return job
+
+
+class JobContext:
+    """Handed to job handlers for reporting progress and honouring cancel/throttle."""
+
+    def __init__(self, job, runner):
+        self.job = job
+        self.runner = runner
+
+    @property
+    def checkpoint(self):
+        return self.job.checkpoint
+
+    def set_total(self, total):
+        self.job.total = total
+        self.runner.save(self.job)
+
+    def reset(self):
+        """Discard progress and checkpoint, e.g. when the checkpoint no longer applies."""
+        self.job.done = 0
+        self.job._run_done_start = 0
+        self.job.checkpoint = None
+        self.runner.save(self.job)
+
+    def advance(self, n, checkpoint=None):
+        """Record n more units done (and where to resume), then yield to foreground work."""
+        self.job.done += n
+        if checkpoint is not None:
+            self.job.checkpoint = checkpoint
+        self.runner.save(self.job)
+        self.throttle()
+
+    def throttle(self):
+        if self.job.cancel_event.is_set():
+            raise JobCancelled()
+
+        started = time.time()
+        if JOB_BATCH_PAUSE_MS:
+            self.job.cancel_event.wait(JOB_BATCH_PAUSE_MS / 1000.0)
+        delay = 0.05
+        while (self.runner.monitor.over_budget() and not self.job.cancel_event.is_set()
+               and time.time() - started < JOB_MAX_BACKOFF_SECONDS):
+            self.job.cancel_event.wait(delay)
+            delay = min(delay * 2, 1.0)
+        self.job.throttled_seconds += time.time() - started
+
+        if self.job.cancel_event.is_set():
+            raise JobCancelled()
+
+
+class JobKind:
+    def __init__(self, handler, params=(), validate=None, conflicts=()):
+        self.handler = handler
+        # Only these keys may be passed through from a submit request
+        self.params = set(params)
+        self.validate = validate
+        # Other kinds that must not be queued or running at the same time
+        self.conflicts = set(conflicts)
+
+
+class JobRunner:
+    def __init__(self, workers=JOB_WORKERS, state_dir=JOB_STATE_DIR, monitor=None):
+        self.kinds = {}
+        self.state_dir = state_dir
+        self.monitor = monitor or LatencyMonitor()
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+        os.makedirs(state_dir, exist_ok=True)
+        for name in sorted(os.listdir(state_dir)):
+            if name.endswith(".json"):
+                with open(os.path.join(state_dir, name), "r") as f:
+                    job = Job.from_dict(json.load(f))
+                # Anything in flight when the process stopped can be resumed from its checkpoint
+                if job.status in ("queued", "running"):
+                    job.status = "interrupted"
+                self.jobs[job.id] = job
+
+    def register(self, kind, handler, params=(), validate=None, conflicts=()):
+        self.kinds[kind] = JobKind(handler, params, validate, conflicts)
+
+    def _check_conflicts(self, kind):
+        blocked = {kind} | self.kinds[kind].conflicts
+        for other in self.jobs.values():
+            if other.status not in ACTIVE_STATES:
+                continue
+            other_kind = self.kinds.get(other.kind)
+            if other.kind in blocked or (other_kind and kind in other_kind.conflicts):
+                raise ValueError(f"A {other.kind} job ({other.id}) is already {other.status}")
+
+    def save(self, job):
+        job.updated_at = time.time()
+        path = os.path.join(self.state_dir, f"{job.id}.json")
+        with self._lock:
+            with open(path + ".tmp", "w") as f:
+                json.dump(job.to_dict(), f)
+            os.replace(path + ".tmp", path)
+
+    def submit(self, kind, params=None):
+        spec = self.kinds.get(kind)
+        if spec is None:
+            raise ValueError(f"Unknown job kind: {kind}")
+        params = params or {}
+        unknown = sorted(set(params) - spec.params)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {kind} job: {', '.join(unknown)}")
+        if spec.validate:
+            spec.validate(params)
+
+        with self._submit_lock:
+            self._check_conflicts(kind)
+            job = Job(kind, params)
+            self.jobs[job.id] = job
+            self._enqueue(job)
+        return job
+
+    def resume(self, job_id):
+        with self._submit_lock:
+            job = self.jobs[job_id]
+            if job.status not in RESUMABLE_STATES:
+                raise ValueError(f"Job {job_id} is {job.status} and cannot be resumed")
+            if job.kind not in self.kinds:
+                raise ValueError(f"Unknown job kind: {job.kind}")
+            self._check_conflicts(job.kind)
+            job.cancel_event = threading.Event()
+            job.status = "queued"
+            job.error = None
+            self._enqueue(job)
+        return job
+
+    def cancel(self, job_id):
+        job = self.jobs[job_id]
+        job.cancel_event.set()
+        if job.status == "queued":
+            job.status = "cancelled"
+            self.save(job)
+        return job
+
+    def _enqueue(self, job):
+        self.save(job)
+        self._pool.submit(self._run, job, job.cancel_event)
+
+    def _run(self, job, cancel_event):
+        # A job cancelled while queued and then resumed has a newer queue entry
+        if cancel_event.is_set() or cancel_event is not job.cancel_event:
+            return
+
+        job.status = "running"
+        job._run_started = time.time()
+        job._run_done_start = job.done
+        self.save(job)
+        try:
+            job.result = self.kinds[job.kind].handler(JobContext(job, self), **job.params)
+            job.status = "completed"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        self.save(job)
@@ -0,0 +1,346 @@
+import os
+import json
+import re
+import atexit
+import hashlib
+import math
+import time
+import threading
+
+# Set CORE_MEMORY_INDEX=local to run every script against this in-process index
+# instead of Pinecone, and against a deterministic local embedder instead of
+# OpenAI (see LocalEmbeddings), so the whole pipeline runs offline. The index lives in memory and is written to LOCAL_INDEX_FILE
+# on flush() and at interpreter exit, so consecutive script runs (e.g.
+# reset_and_migrate.py then export_live_memories_py) see the same data without
+# per-call disk writes distorting batching benchmarks.
+INDEX_BACKEND_ENV = "CORE_MEMORY_INDEX"
+LOCAL_INDEX_FILE = os.getenv("LOCAL_INDEX_FILE", "local_index.json")
+LOCAL_INDEX_LATENCY_MS = float(os.getenv("LOCAL_INDEX_LATENCY_MS", "0"))
+
+# Filters and metadata are validated the way Pinecone does, so scripts that the
+# real index would reject fail here too:
+#   - metadata values must be strings, numbers, booleans or lists of strings (no nulls)
+#   - $gt/$gte/$lt/$lte only accept numbers; $in/$nin need a list operand. Dates
+#     are stored as "YYYY-MM-DD" strings, so range filters go through the numeric
+#     date_num field (YYYYMMDD) that the upload scripts write alongside them
+#   - a list field matches $eq/$in when any element matches
+# One deliberate deviation: Pinecone has no $contains operator. query_helper.py
+# uses it for tags, so it is accepted here as list membership (never substring).
+
+
+class Record(dict):
+    """Dict that also allows attribute access, like Pinecone's response objects."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+# --- Metadata validation ---
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_scalar(value):
+    return isinstance(value, (str, bool)) or _is_number(value)
+
+
+def validate_metadata(metadata):
+    for key, value in (metadata or {}).items():
+        if _is_scalar(value):
+            continue
+        if isinstance(value, list) and all(isinstance(v, str) for v in value):
+            continue
+        raise ValueError(
+            f"Metadata value for field '{key}' must be a string, number, boolean or list of strings, "
+            f"got {json.dumps(value)}"
+        )
+
+
+# --- Metadata filters ---
+def _contains(value, operand):
+    return isinstance(value, list) and operand in value
+
+
+def _compare(op, value, operand):
+    if not _is_number(value):
+        return False
+    if op == "$gt":
+        return value > operand
+    if op == "$gte":
+        return value >= operand
+    if op == "$lt":
+        return value < operand
+    return value <= operand
+
+
+def _check_operand(op, operand):
+    if op in ("$gt", "$gte", "$lt", "$lte") and not _is_number(operand):
+        raise ValueError(f"{op} operator only supports numbers, got {json.dumps(operand)}")
+    if op in ("$in", "$nin") and not isinstance(operand, list):
+        raise ValueError(f"{op} operator requires a list, got {json.dumps(operand)}")
+    if op in ("$eq", "$ne", "$contains") and not _is_scalar(operand):
+        raise ValueError(f"{op} operator requires a string, number or boolean, got {json.dumps(operand)}")
+    if op == "$exists" and not isinstance(operand, bool):
+        raise ValueError(f"$exists operator requires a boolean, got {json.dumps(operand)}")
+
+
+_OPERATORS = {
+    "$eq": lambda value, operand: value == operand or (isinstance(value, list) and operand in value),
+    "$ne": lambda value, operand: value != operand and not (isinstance(value, list) and operand in value),
+    "$in": lambda value, operand: any(v in operand for v in value) if isinstance(value, list) else value in operand,
+    "$nin": lambda value, operand: not (any(v in operand for v in value) if isinstance(value, list) else value in operand),
+    "$contains": _contains,
+    "$gt": lambda value, operand: _compare("$gt", value, operand),
+    "$gte": lambda value, operand: _compare("$gte", value, operand),
+    "$lt": lambda value, operand: _compare("$lt", value, operand),
+    "$lte": lambda value, operand: _compare("$lte", value, operand),
+    "$exists": lambda value, operand: (value is not None) == operand,
+}
+
+
+def validate_filter(flt):
+    """Raise ValueError for a filter Pinecone would reject, whether or not any record matches."""
+    for key, cond in (flt or {}).items():
+        if key in ("$and", "$or"):
+            if not isinstance(cond, list):
+                raise ValueError(f"{key} operator requires a list, got {json.dumps(cond)}")
+            for sub in cond:
+                validate_filter(sub)
+            continue
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, operand in cond.items():
+            if op not in _OPERATORS:
+                raise ValueError(f"Unsupported filter operator: {op}")
+            _check_operand(op, operand)
+
+
+def matches_filter(metadata, flt):
+    """Evaluate a metadata filter (already checked by validate_filter) against one record."""
+    if not flt:
+        return True
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in cond):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in cond):
+                return False
+            continue
+
+        value = metadata.get(key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, operand in cond.items():
+            if op == "$exists":
+                if not _OPERATORS[op](value, operand):
+                    return False
+            elif value is None:
+                if op not in ("$ne", "$nin"):
+                    return False
+            elif not _OPERATORS[op](value, operand):
+                return False
+    return True
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+# --- Index ---
+class LocalIndex:
+    """In-process stand-in for the subset of pinecone.Index the scripts use."""
+
+    def __init__(self, path=LOCAL_INDEX_FILE, dimension=1536, latency_ms=LOCAL_INDEX_LATENCY_MS):
+        self.path = path
+        self.dimension = dimension
+        self.latency_ms = latency_ms
+        self.calls = {"query": 0, "upsert": 0, "delete": 0, "describe_index_stats": 0, "update": 0}
+        self._lock = threading.Lock()
+        # namespace -> {id: {"values": [...], "metadata": {...}}}
+        self._namespaces = {}
+        self._dirty = False
+
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                self._namespaces = json.load(f)
+        if path:
+            atexit.register(self.flush)
+
+    def _call(self, name):
+        self.calls[name] += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def flush(self):
+        """Write the index to LOCAL_INDEX_FILE if anything changed since the last flush."""
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._namespaces, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def upsert(self, vectors, namespace=""):
+        self._call("upsert")
+        with self._lock:
+            ns = self._namespaces.setdefault(namespace, {})
+            for vec in vectors:
+                if isinstance(vec, (tuple, list)):
+                    vec = {"id": vec[0], "values": vec[1], "metadata": vec[2] if len(vec) > 2 else {}}
+                validate_metadata(vec.get("metadata"))
+                if len(vec["values"]) != self.dimension:
+                    raise ValueError(
+                        f"Vector dimension {len(vec['values'])} does not match the dimension of the index {self.dimension}"
+                    )
+                ns[vec["id"]] = {"values": list(vec["values"]), "metadata": vec.get("metadata") or {}}
+            self._dirty = True
+        return Record(upserted_count=len(vectors))
+
+    def update(self, id, values=None, set_metadata=None, namespace=""):
+        self._call("update")
+        validate_metadata(set_metadata)
+        with self._lock:
+            rec = self._namespaces.get(namespace, {}).get(id)
+            if rec is not None:
+                if values is not None:
+                    rec["values"] = list(values)
+                if set_metadata:
+                    rec["metadata"].update(set_metadata)
+                self._dirty = True
+        return Record()
+
+    def delete(self, ids=None, delete_all=False, filter=None, namespace=""):
+        self._call("delete")
+        validate_filter(filter)
+        with self._lock:
+            ns = self._namespaces.get(namespace, {})
+            if delete_all:
+                ns.clear()
+            elif ids:
+                for vid in ids:
+                    ns.pop(vid, None)
+            elif filter:
+                for vid in [k for k, v in ns.items() if matches_filter(v["metadata"], filter)]:
+                    del ns[vid]
+            self._dirty = True
+        return Record()
+
+    def query(self, vector=None, top_k=10, include_metadata=False, include_values=False,
+              filter=None, namespace="", id=None):
+        self._call("query")
+        validate_filter(filter)
+        with self._lock:
+            ns = self._namespaces.get(namespace, {})
+            if id is not None:
+                vector = ns[id]["values"] if id in ns else None
+            if vector is None:
+                raise ValueError("query requires either vector or id")
+
+            scored = []
+            for vid, rec in ns.items():
+                if not matches_filter(rec["metadata"], filter):
+                    continue
+                scored.append((_cosine(vector, rec["values"]), vid, rec))
+
+        # Stable sort keeps insertion order among ties (e.g. the zero-vector queries)
+        scored.sort(key=lambda s: s[0], reverse=True)
+
+        matches = []
+        for score, vid, rec in scored[:top_k]:
+            match = Record(id=vid, score=score)
+            if include_metadata:
+                match["metadata"] = Record(rec["metadata"])
+            if include_values:
+                match["values"] = rec["values"]
+            matches.append(match)
+        return Record(matches=matches, namespace=namespace)
+
+    def describe_index_stats(self, filter=None):
+        self._call("describe_index_stats")
+        validate_filter(filter)
+        with self._lock:
+            namespaces = {}
+            for name, ns in self._namespaces.items():
+                count = sum(1 for rec in ns.values() if matches_filter(rec["metadata"], filter))
+                namespaces[name] = Record(vector_count=count)
+        return Record(
+            dimension=self.dimension,
+            index_fullness=0.0,
+            namespaces=namespaces,
+            total_vector_count=sum(ns["vector_count"] for ns in namespaces.values()),
+        )
+
+
+# One LocalIndex per process: separate instances would each flush their own
+# copy at exit and overwrite one another's writes
+_local_index = None
+_local_index_lock = threading.Lock()
+
+
+def _use_local():
+    return os.getenv(INDEX_BACKEND_ENV, "pinecone").lower() == "local"
+
+
+def open_index(name="core-memory"):
+    """Return the Pinecone index, or the shared LocalIndex when CORE_MEMORY_INDEX=local."""
+    global _local_index
+    if _use_local():
+        with _local_index_lock:
+            if _local_index is None:
+                _local_index = LocalIndex()
+            return _local_index
+
+    import pinecone
+    pc = pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+    return pc.Index(name)
+
+
+# --- Embeddings ---
+class LocalEmbeddings:
+    """Deterministic stand-in for client.embeddings: a hashed, normalised bag of words.
+
+    Texts that share words score closer, which is enough to exercise semantic
+    queries offline; it says nothing about the real model's ranking quality.
+    """
+
+    def __init__(self, dimension=1536):
+        self.dimension = dimension
+
+    def embed(self, text):
+        vec = [0.0] * self.dimension
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vec[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(x * x for x in vec))
+        return [x / norm for x in vec] if norm else vec
+
+    def create(self, model=None, input=""):
+        texts = [input] if isinstance(input, str) else list(input)
+        return Record(
+            model=model,
+            data=[Record(index=i, embedding=self.embed(text)) for i, text in enumerate(texts)],
+        )
+
+
+class LocalEmbeddingClient:
+    def __init__(self, dimension=1536):
+        self.embeddings = LocalEmbeddings(dimension)
+
+
+def open_embedding_client():
+    """Return an OpenAI client, or a LocalEmbeddingClient when CORE_MEMORY_INDEX=local."""
+    if _use_local():
+        return LocalEmbeddingClient()
+
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
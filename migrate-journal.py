@@ -2,15 +2,13 @@ import os
 import json
 import hashlib
 import datetime
-from openai import OpenAI
-import pinecone
+from local_index import open_embedding_client, open_index
 
 print("🚀 migrate_journal.py has started...")
 
 # Initialize OpenAI + Pinecone
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-pc = pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("core-memory")
+client = open_embedding_client()
+index = open_index("core-memory")
 
 # Path to your JSONL journal
 file_path = "journal_with_tags_and_categories.jsonl"
@@ -71,6 +69,7 @@ for i, entry in enumerate(entries):
         "title": title,
         "text": text,
         "date": date_str,             # strict format
+        "date_num": int(dt.strftime("%Y%m%d")),  # numeric, for date range filters
         "date_friendly": date_friendly,  # human format
         "tags": tags,
         "categories": categories,
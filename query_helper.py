@@ -1,9 +1,8 @@
-import os
-from openai import OpenAI
+from local_index import open_embedding_client
 
 def get_openai_client():
-    """Return a reusable OpenAI client"""
-    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    """Return a reusable OpenAI client (a local embedder when CORE_MEMORY_INDEX=local)"""
+    return open_embedding_client()
 
 def universal_query(index, date=None, keyword=None, tag=None, semantic=None, top_k=3):
     """Universal query helper for Pinecone with literal + semantic support"""
@@ -1,15 +1,12 @@
-import os
-from openai import OpenAI
-import pinecone
+from local_index import open_embedding_client, open_index
 
 print("🚀 Running query_test.py...")
 
 # === Initialize OpenAI ===
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = open_embedding_client()
 
 # === Initialize Pinecone ===
-pc = pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("core-memory")
+index = open_index("core-memory")
 
 # === Your test query ===
 query = "Can you tell me about some stressful moments in June?"
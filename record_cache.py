@@ -0,0 +1,59 @@
+import json
+import threading
+
+# orjson is several times faster than the stdlib encoder; fall back if it is missing
+try:
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    orjson = None
+
+    def dumps(obj):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class EncodedRecordCache:
+    """Holds each hot memory's JSON bytes so responses can be assembled without re-encoding.
+
+    Entries are keyed by memory id (ids are unique across both tiers) and must be
+    invalidated whenever the record changes. Each invalidation bumps a per-id
+    generation, so an encode that raced with an update is never cached.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._encoded = {}
+        self._generations = {}
+        self._epoch = 0
+
+    def get(self, mem):
+        memory_id = mem["id"]
+        encoded = self._encoded.get(memory_id)
+        if encoded is not None:
+            return encoded
+
+        with self._lock:
+            seen = (self._epoch, self._generations.get(memory_id, 0))
+        encoded = dumps(mem)
+        with self._lock:
+            if (self._epoch, self._generations.get(memory_id, 0)) == seen:
+                self._encoded[memory_id] = encoded
+        return encoded
+
+    def invalidate(self, memory_id):
+        with self._lock:
+            self._encoded.pop(memory_id, None)
+            self._generations[memory_id] = self._generations.get(memory_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._encoded.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+
+def encode_results(parts):
+    """Join already-encoded records into a {"results": [...]} body."""
+    return b'{"results":[' + b",".join(parts) + b"]}"
@@ -1,15 +1,13 @@
 import os
 import json
 from datetime import datetime
-from openai import OpenAI
-import pinecone
+from local_index import open_embedding_client, open_index
 
 print("🚀 Running reset_and_migrate.py...")
 
 # === Initialize OpenAI + Pinecone ===
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-pc = pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("core-memory")
+client = open_embedding_client()
+index = open_index("core-memory")
 
 # === 1. Wipe the index ===
 print("🧹 Deleting ALL entries from core-memory...")
@@ -28,9 +26,9 @@ def embed_text(text: str):
 def normalize_date(date_str):
     try:
         dt = datetime.strptime(date_str, "%Y-%m-%d")
-        return dt.strftime("%Y-%m-%d"), dt.strftime("%B %d, %Y")
+        return dt.strftime("%Y-%m-%d"), dt.strftime("%B %d, %Y"), int(dt.strftime("%Y%m%d"))
     except:
-        return None, date_str  # fallback
+        return None, date_str, None  # fallback
 
 # === 2. Upload entries from a file ===
 def upload_entries(path, prefix):
@@ -46,22 +44,26 @@ def upload_entries(path, prefix):
     vectors = []
     for i, entry in enumerate(entries):
         text = entry.get("text", "")
-        date_str, date_friendly = normalize_date(entry.get("date", ""))
+        date_str, date_friendly, date_num = normalize_date(entry.get("date", ""))
 
         emb = embed_text(text)
 
+        metadata = {
+            "title": entry.get("title", f"{prefix.title()} Entry {i}"),
+            "text": text,
+            "tags": entry.get("tags", []),
+            "categories": entry.get("categories", []),
+            "date": date_str,
+            "date_num": date_num,  # YYYYMMDD, for $gte/$lt date ranges
+            "date_friendly": date_friendly,
+            "source": prefix
+        }
+
         vectors.append({
             "id": entry.get("id", f"{prefix}-{i}"),
             "values": emb,
-            "metadata": {
-                "title": entry.get("title", f"{prefix.title()} Entry {i}"),
-                "text": text,
-                "tags": entry.get("tags", []),
-                "categories": entry.get("categories", []),
-                "date": date_str,
-                "date_friendly": date_friendly,
-                "source": prefix
-            }
+            # Pinecone rejects nulls, e.g. for entries whose date did not parse
+            "metadata": {k: v for k, v in metadata.items() if v is not None}
         })
 
         # Batch upload every 50
@@ -0,0 +1,151 @@
+import os
+import json
+from change_feed import ChangeFeed
+from local_index import open_index
+from query_helper import get_openai_client
+
+# Incrementally pushes API mutations into the vector index by consuming the
+# change feed from the last acknowledged position. Only entries whose
+# text changed are re-embedded, so cost follows churn rather than corpus size.
+SYNC_CURSOR_FILE = "sync_cursor.json"
+CHANGES_PER_PASS = 1000
+EMBED_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 1000
+
+
+def load_cursor(path=SYNC_CURSOR_FILE):
+    """Return the acknowledged {"seq", "segment", "offset"}.
+
+    segment and offset locate where the next unread feed line starts.
+    """
+    cursor = {"seq": 0, "segment": 0, "offset": 0}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            cursor.update(json.load(f))
+    return cursor
+
+
+def save_cursor(seq, segment, offset, path=SYNC_CURSOR_FILE):
+    with open(path + ".tmp", "w") as f:
+        json.dump({"seq": seq, "segment": segment, "offset": offset}, f)
+    os.replace(path + ".tmp", path)
+
+
+def build_metadata(entry):
+    """Flatten an API memory into Pinecone metadata (no nulls allowed)."""
+    meta = entry.get("meta") or {}
+    datetime_iso = meta.get("datetime_iso") or ""
+    date_digits = datetime_iso[:10].replace("-", "")
+    metadata = {
+        "kind": entry.get("kind"),
+        "text": entry.get("text"),
+        "tags": entry.get("tags") or [],
+        "mood": entry.get("mood"),
+        "people": entry.get("people") or [],
+        "activities": entry.get("activities") or [],
+        "keywords": entry.get("keywords") or [],
+        "date": datetime_iso[:10],
+        # Numeric YYYYMMDD copy, since range filters only accept numbers
+        "date_num": int(date_digits) if len(date_digits) == 8 and date_digits.isdigit() else None,
+        "datetime_iso": datetime_iso,
+        "timezone": meta.get("timezone"),
+        "source": "api",
+    }
+    return {k: v for k, v in metadata.items() if v is not None}
+
+
+def collapse_changes(changes):
+    """Reduce a run of changes to the net action needed per id."""
+    pending = {}
+    for change in changes:
+        if change["op"] not in ("store", "update", "delete"):
+            continue
+
+        state = pending.setdefault(change["id"], {"entry": None, "reembed": False, "deleted": False})
+        if change["op"] == "delete":
+            state.update(entry=None, reembed=False, deleted=True)
+        else:
+            state["entry"] = change["entry"]
+            state["deleted"] = False
+            if change["op"] == "store" or change["text_changed"]:
+                state["reembed"] = True
+    return pending
+
+
+def embed_texts(client, texts):
+    response = client.embeddings.create(
+        model="text-embedding-3-small",
+        input=texts
+    )
+    return [item.embedding for item in response.data]
+
+
+def apply_changes(index, client, pending):
+    deletes = [vid for vid, s in pending.items() if s["deleted"]]
+    reembeds = [(vid, s["entry"]) for vid, s in pending.items() if s["reembed"]]
+    metadata_only = [(vid, s["entry"]) for vid, s in pending.items() if not s["deleted"] and not s["reembed"]]
+
+    for i in range(0, len(deletes), DELETE_BATCH_SIZE):
+        index.delete(ids=deletes[i:i + DELETE_BATCH_SIZE])
+
+    for i in range(0, len(reembeds), EMBED_BATCH_SIZE):
+        batch = reembeds[i:i + EMBED_BATCH_SIZE]
+        embeddings = embed_texts(client, [entry["text"] for _, entry in batch])
+        index.upsert(vectors=[
+            {"id": vid, "values": emb, "metadata": build_metadata(entry)}
+            for (vid, entry), emb in zip(batch, embeddings)
+        ])
+
+    # Metadata edits keep their vector; only the filterable fields are refreshed.
+    for vid, entry in metadata_only:
+        index.update(id=vid, set_metadata=build_metadata(entry))
+
+    return {"deleted": len(deletes), "reembedded": len(reembeds), "metadata_updated": len(metadata_only)}
+
+
+def sync_once(index=None, feed=None, client=None, cursor_path=SYNC_CURSOR_FILE, on_pass=None):
+    """Consume every change after the acknowledged cursor and apply it to the index.
+
+    on_pass(changes_applied, seq) is called after each acknowledged pass.
+    """
+    index = index or open_index("core-memory")
+    feed = feed or ChangeFeed()
+    totals = {"deleted": 0, "reembedded": 0, "metadata_updated": 0, "changes": 0}
+
+    cursor = load_cursor(cursor_path)
+    seq, segment, offset = cursor["seq"], cursor["segment"], cursor["offset"]
+    while True:
+        changes, next_segment, next_offset = feed.read_from(segment, offset, limit=CHANGES_PER_PASS)
+        if (next_segment, next_offset) == (segment, offset):
+            break
+        segment, offset = next_segment, next_offset
+        if not changes:
+            continue
+
+        pending = collapse_changes(changes)
+        if any(s["reembed"] for s in pending.values()):
+            client = client or get_openai_client()
+        stats = apply_changes(index, client, pending)
+
+        # Acknowledge only after the whole pass has been applied; replays are idempotent.
+        seq = changes[-1]["seq"]
+        save_cursor(seq, segment, offset, cursor_path)
+        # Segments before the acknowledged one are never read again
+        feed.trim(segment)
+
+        totals["changes"] += len(changes)
+        for key, value in stats.items():
+            totals[key] += value
+        if on_pass:
+            on_pass(len(changes), seq)
+
+    totals["seq"] = seq
+    return totals
+
+
+if __name__ == "__main__":
+    print("🚀 Running sync_index.py...")
+    totals = sync_once()
+    print(f"✅ Synced {totals['changes']} changes up to seq {totals['seq']}: "
+          f"{totals['reembedded']} re-embedded, {totals['metadata_updated']} metadata-only, "
+          f"{totals['deleted']} deleted.")
@@ -0,0 +1,64 @@
+import os
+
+from change_feed import ChangeFeed
+
+
+def fill(feed, n):
+    for i in range(n):
+        feed.append("store", f"m-{i}", {"id": f"m-{i}", "text": "x" * 40}, text_changed=True)
+
+
+def test_reader_leaves_an_append_in_progress_alone(tmp_path):
+    writer = ChangeFeed(str(tmp_path), writer=True)
+    fill(writer, 3)
+    path = writer._path(writer.segments()[-1])
+    with open(path, "ab") as f:
+        f.write(b'{"seq": 4, "op": "st')
+    size = os.path.getsize(path)
+
+    reader = ChangeFeed(str(tmp_path))
+    changes, segment, offset = reader.read_from(0, 0)
+    assert [c["seq"] for c in changes] == [1, 2, 3]
+    assert os.path.getsize(path) == size
+    assert reader.read_from(segment, offset) == ([], segment, offset)
+
+
+def test_writer_truncates_a_torn_tail_on_startup(tmp_path):
+    writer = ChangeFeed(str(tmp_path), writer=True)
+    fill(writer, 3)
+    with open(writer._path(writer.segments()[-1]), "ab") as f:
+        f.write(b'{"seq": 4, "op": "st')
+
+    writer = ChangeFeed(str(tmp_path), writer=True)
+    assert writer.last_seq == 3
+    assert writer.append("delete", "m-0") == 4
+    changes, _, _ = ChangeFeed(str(tmp_path)).read_from(0, 0)
+    assert [c["seq"] for c in changes] == [1, 2, 3, 4]
+
+
+def test_unreadable_line_is_skipped(tmp_path):
+    writer = ChangeFeed(str(tmp_path), writer=True)
+    fill(writer, 2)
+    with open(writer._path(writer.segments()[-1]), "ab") as f:
+        f.write(b"not json\n")
+    writer.append("delete", "m-0")
+
+    changes, _, _ = ChangeFeed(str(tmp_path)).read_from(0, 0)
+    assert [c["seq"] for c in changes] == [1, 2, 3]
+
+
+def test_segments_roll_over_and_trim_past_the_cursor(tmp_path):
+    writer = ChangeFeed(str(tmp_path), writer=True, segment_bytes=200)
+    fill(writer, 10)
+    assert len(writer.segments()) > 2
+
+    reader = ChangeFeed(str(tmp_path))
+    changes, segment, offset = reader.read_from(0, 0, limit=5)
+    assert [c["seq"] for c in changes] == [1, 2, 3, 4, 5]
+    reader.trim(segment)
+    assert writer.segments()[0] == segment
+
+    changes, segment, offset = reader.read_from(segment, offset)
+    assert [c["seq"] for c in changes] == [6, 7, 8, 9, 10]
+    assert segment == writer.segments()[-1]
+    assert ChangeFeed(str(tmp_path), writer=True).last_seq == 10
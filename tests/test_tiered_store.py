@@ -0,0 +1,195 @@
+import os
+import json
+
+import pytest
+
+from tiered_store import ColdStore
+
+
+class Crash(Exception):
+    """Stands in for the process dying at a given step."""
+
+
+def memory(memory_id, day="2020-01-15", **fields):
+    return dict({"id": memory_id, "text": f"text {memory_id}", "kind": "note",
+                 "tags": [], "meta": {"datetime_iso": f"{day}T10:00:00"}}, **fields)
+
+
+def cold_ids(store):
+    with store.snapshot() as snap:
+        return sorted(mem["id"] for _, _, mem in snap.iter_records())
+
+
+def segment_files(directory):
+    return sorted(n for n in os.listdir(directory) if n.endswith(".jsonl.gz"))
+
+
+def save_hot(hot_file, ids):
+    with open(hot_file, "w") as f:
+        json.dump(sorted(ids), f)
+
+
+def seal(store, memories, hot_file):
+    """Seal like the app does: stage, persist the hot tier without the records, commit."""
+    staged = store.stage_seal(memories, horizon_days=0)
+    save_hot(hot_file, [])
+    store.commit_seal(staged, {m["id"] for m in memories})
+
+
+def reopen(directory, hot_file):
+    store = ColdStore(directory)
+    if os.path.exists(hot_file):
+        with open(hot_file) as f:
+            store.reconcile(set(json.load(f)))
+    return store
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "segments"), str(tmp_path / "hot.json")
+
+
+def test_compaction_merges_small_segments_of_the_same_month(paths):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    for i in range(4):
+        seal(store, [memory(f"jan-{i}"), memory(f"feb-{i}", day="2020-02-03")], hot_file)
+    store.tombstone(store.locate("jan-2")[1], "jan-2")
+
+    assert store.stats()["segments"] == 8
+    assert store.compact() == 8
+    assert [s["partition"] for s in store.segments] == ["2020-01", "2020-02"]
+    assert cold_ids(store) == ["feb-0", "feb-1", "feb-2", "feb-3", "jan-0", "jan-1", "jan-3"]
+    assert len(segment_files(directory)) == 2
+    assert store.plan_compaction() == []
+
+
+def test_compaction_splits_output_at_the_target_size(paths):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    for i in range(5):
+        seal(store, [memory(f"m-{i}")], hot_file)
+
+    store.compact(target=4)
+    assert sorted(s["count"] for s in store.segments) == [1, 4]
+    assert cold_ids(store) == [f"m-{i}" for i in range(5)]
+
+
+def test_crash_after_compaction_output_written_keeps_each_record_once(paths, monkeypatch):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    for i in range(3):
+        seal(store, [memory(f"m-{i}")], hot_file)
+    store.tombstone(store.locate("m-1")[1], "m-1")
+
+    write = ColdStore._write_segment
+
+    def write_then_crash(self, name, partition, memories):
+        write(self, name, partition, memories)
+        raise Crash()
+    monkeypatch.setattr(ColdStore, "_write_segment", write_then_crash)
+    with pytest.raises(Crash):
+        store.compact()
+    monkeypatch.undo()
+
+    store = reopen(directory, hot_file)
+    assert cold_ids(store) == ["m-0", "m-2"]
+    assert store.stats() == {"segments": 3, "cold_memories": 2}
+    assert len(segment_files(directory)) == 3
+    assert store.compact() == 3
+    assert cold_ids(store) == ["m-0", "m-2"]
+
+
+def test_crash_before_replaced_segments_are_removed(paths, monkeypatch):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    for i in range(3):
+        seal(store, [memory(f"m-{i}")], hot_file)
+
+    def crash(self, name):
+        raise Crash()
+    monkeypatch.setattr(ColdStore, "_remove_obsolete", crash)
+    with pytest.raises(Crash):
+        store.compact()
+    monkeypatch.undo()
+
+    store = reopen(directory, hot_file)
+    assert cold_ids(store) == ["m-0", "m-1", "m-2"]
+    assert len(segment_files(directory)) == 1
+
+
+def test_crash_before_hot_tier_rewritten_is_reconciled(paths):
+    directory, hot_file = paths
+    save_hot(hot_file, ["m-0", "m-1"])
+    store = ColdStore(directory)
+    store.stage_seal([memory("m-0"), memory("m-1")], horizon_days=0)
+
+    # Both records are still hot, so the adopted cold copies are tombstoned
+    store = reopen(directory, hot_file)
+    assert cold_ids(store) == []
+    assert store.stats()["cold_memories"] == 0
+
+
+def test_crash_after_hot_tier_rewritten_adopts_the_seal(paths):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    store.stage_seal([memory("m-0"), memory("m-1", day="2020-02-01")], horizon_days=0)
+    save_hot(hot_file, [])
+
+    store = reopen(directory, hot_file)
+    assert cold_ids(store) == ["m-0", "m-1"]
+    assert store.pending == {}
+
+
+def test_records_changed_during_a_seal_stay_hot(paths):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    staged = store.stage_seal([memory("m-0"), memory("m-1"), memory("m-2")], horizon_days=0)
+    # m-1 was updated and m-2 deleted while the segment was written
+    save_hot(hot_file, ["m-1"])
+    store.commit_seal(staged, {"m-0"})
+
+    assert cold_ids(store) == ["m-0"]
+    assert store.stats()["cold_memories"] == 1
+
+
+def test_torn_seal_segment_is_discarded(paths, monkeypatch):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+
+    def torn_write(self, name, partition, memories):
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(b"\x1f\x8b\x08")
+        raise Crash()
+    monkeypatch.setattr(ColdStore, "_write_segment", torn_write)
+    with pytest.raises(Crash):
+        seal(store, [memory("m-0")], hot_file)
+    monkeypatch.undo()
+
+    store = reopen(directory, hot_file)
+    assert store.segments == []
+    assert segment_files(directory) == []
+
+
+def test_unregistered_segment_file_is_not_adopted(paths):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    seal(store, [memory("m-0")], hot_file)
+    stray = os.path.join(directory, "seg-000099-2020-01.jsonl.gz")
+    with open(os.path.join(directory, segment_files(directory)[0]), "rb") as src, open(stray, "wb") as dst:
+        dst.write(src.read())
+
+    store = reopen(directory, hot_file)
+    assert cold_ids(store) == ["m-0"]
+
+
+def test_tombstone_follows_a_record_into_its_compacted_segment(paths):
+    directory, hot_file = paths
+    store = ColdStore(directory)
+    for i in range(3):
+        seal(store, [memory(f"m-{i}")], hot_file)
+    _, located = store.locate("m-1")
+
+    store.compact()
+    store.tombstone(located, "m-1")
+    assert cold_ids(store) == ["m-0", "m-2"]
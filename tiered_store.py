@@ -0,0 +1,500 @@
+import os
+import json
+import gzip
+import base64
+import hashlib
+import threading
+from datetime import date, timedelta
+
+# Memories older than HOT_HORIZON_DAYS are sealed out of memory_cache.json into
+# immutable, gzip-compressed, month-partitioned segment files. Only a small
+# summary per segment (date range, count, bloom filters) stays in RAM, and
+# queries open just the segments whose summary says they can match.
+SEGMENT_DIR = "segments"
+HOT_HORIZON_DAYS = int(os.getenv("HOT_HORIZON_DAYS", "90"))
+# Compaction merges segments of the same month below half this size, and
+# splits what it writes into segments of at most this many records
+SEGMENT_TARGET_RECORDS = int(os.getenv("SEGMENT_TARGET_RECORDS", "5000"))
+
+# Memory fields that get a bloom filter per segment, so facet queries can skip segments
+FACETS = ("kind", "tags", "people", "mood", "activities")
+
+
+class BloomFilter:
+    def __init__(self, num_bits=64, num_hashes=7, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, n):
+        # ~10 bits per value with 7 hashes gives roughly a 1% false-positive rate
+        return cls(num_bits=max(64, n * 10))
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(str(value).encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos // 8] |= 1 << (pos % 8)
+
+    def __contains__(self, value):
+        return all(self.bits[pos // 8] & (1 << (pos % 8)) for pos in self._positions(value))
+
+    def to_dict(self):
+        return {"m": self.num_bits, "k": self.num_hashes, "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(num_bits=d["m"], num_hashes=d["k"], bits=base64.b64decode(d["bits"]))
+
+
+def memory_date(mem):
+    return ((mem.get("meta") or {}).get("datetime_iso") or "")[:10]
+
+
+def facet_values(mem, facet):
+    value = mem.get(facet)
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def hot_cutoff(horizon_days=HOT_HORIZON_DAYS):
+    return (date.today() - timedelta(days=horizon_days)).isoformat()
+
+
+def _any_in(bloom, values):
+    return any(v in bloom for v in values)
+
+
+def _all_in(bloom, values):
+    return all(v in bloom for v in values)
+
+
+def segment_may_match(summary, req):
+    """Decide from a segment summary alone whether it can hold a match for req."""
+    if req.date and not (summary["min_date"] <= req.date <= summary["max_date"]):
+        return False
+    if req.date_from and summary["max_date"] < req.date_from:
+        return False
+    if req.date_to and summary["min_date"] > req.date_to:
+        return False
+
+    blooms = summary["blooms"]
+    if req.kinds and not _any_in(blooms["kind"], req.kinds):
+        return False
+    if req.tags_contains and not _all_in(blooms["tags"], req.tags_contains):
+        return False
+    if req.tags_contains_all and not _all_in(blooms["tags"], req.tags_contains_all):
+        return False
+    if req.tags_contains_any and not _any_in(blooms["tags"], req.tags_contains_any):
+        return False
+    if req.people_contains_any and not _any_in(blooms["people"], req.people_contains_any):
+        return False
+    if req.mood_contains_any and not _any_in(blooms["mood"], req.mood_contains_any):
+        return False
+    if req.activities_contains_any and not _any_in(blooms["activities"], req.activities_contains_any):
+        return False
+    return True
+
+
+class ColdSnapshot:
+    """Point-in-time view of the cold tier for one reader.
+
+    The segments and tombstones are captured when the snapshot is taken, and the
+    segment files stay on disk until close() even if compact() replaces them.
+    generation identifies the tier layout, so a checkpoint taken against one
+    snapshot is only meaningful for another with the same generation.
+    """
+
+    def __init__(self, store, pinned, generation):
+        self.store = store
+        self.pinned = pinned
+        self.generation = generation
+        self.count = sum(s["count"] - len(dead) for s, dead in pinned)
+
+    def scan(self, req):
+        """Yield (memory, its stored JSON bytes) for live records in segments that can match req."""
+        for summary, dead in self.pinned:
+            if segment_may_match(summary, req):
+                for _, mem, raw in self.store._read_segment(summary, dead):
+                    yield mem, raw
+
+    def iter_records(self):
+        """Yield (segment name, offset, memory) for every live cold memory in a stable order."""
+        for summary, dead in sorted(self.pinned, key=lambda p: p[0]["name"]):
+            for offset, mem, _ in self.store._read_segment(summary, dead):
+                yield summary["name"], offset, mem
+
+    def close(self):
+        if self.pinned is not None:
+            self.store._unpin([s["name"] for s, _ in self.pinned])
+            self.pinned = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ColdStore:
+    def __init__(self, directory=SEGMENT_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self._lock = threading.Lock()
+        self.segments = []
+        # segment name -> ids removed from it (updated records move back to the hot tier)
+        self.tombstones = {}
+        # Segment files replaced by compact() that may still be on disk
+        self.obsolete = set()
+        # Segment files being written, recorded before they are created:
+        # name -> {"kind": "seal"} or {"kind": "compact", "replaces": [names]}
+        self.pending = {}
+        # segment name -> open ColdSnapshots; compact() defers removing a file until it drops to 0
+        self._readers = {}
+        # Bumped on every manifest change (seal, tombstone, compaction)
+        self.generation = 0
+        self.next_segment = 1
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r") as f:
+                manifest = json.load(f)
+            self.next_segment = manifest["next_segment"]
+            self.generation = manifest.get("generation", 0)
+            self.tombstones = {name: set(ids) for name, ids in manifest["tombstones"].items()}
+            self.obsolete = set(manifest.get("obsolete", []))
+            self.pending = manifest.get("pending", {})
+            for summary in manifest["segments"]:
+                summary["blooms"] = {name: BloomFilter.from_dict(b) for name, b in summary["blooms"].items()}
+                self.segments.append(summary)
+        if os.path.isdir(directory):
+            self._recover_files()
+
+    # --- Persistence ---
+    def _recover_files(self):
+        """Finish work a crash interrupted, using the pending and obsolete lists.
+
+        A seal writes its segments, then persists the hot tier without those
+        records, then registers the segments. Its pending segments are adopted
+        if they were written completely; if the hot tier was not rewritten yet,
+        reconcile() tombstones the duplicate cold copies. A compaction registers
+        its output only together with retiring the segments it replaces, so its
+        pending output is discarded and the originals stay authoritative.
+        """
+        changed = bool(self.obsolete or self.pending)
+        for name in self.obsolete:
+            if os.path.exists(os.path.join(self.directory, name)):
+                os.remove(os.path.join(self.directory, name))
+        self.obsolete = set()
+
+        for name, entry in sorted(self.pending.items()):
+            path = os.path.join(self.directory, name)
+            if not os.path.exists(path):
+                continue
+            if entry["kind"] != "seal":
+                os.remove(path)
+                continue
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    memories = [json.loads(line) for line in f]
+            except (EOFError, OSError, ValueError):
+                # Torn write: the seal never got as far as rewriting the hot tier
+                os.remove(path)
+                continue
+            if memories:
+                self.segments.append(self._summarize(name, entry["partition"], memories))
+            else:
+                os.remove(path)
+        self.pending = {}
+
+        known = {s["name"] for s in self.segments}
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith("seg-") and name.endswith(".jsonl.gz") and name not in known:
+                print(f"⚠️ Ignoring unregistered segment file {name}")
+
+        if changed:
+            self.segments.sort(key=lambda s: s["name"])
+            self._save_manifest()
+
+    def _save_manifest(self):
+        self.generation += 1
+        manifest = {
+            "next_segment": self.next_segment,
+            "generation": self.generation,
+            "obsolete": sorted(self.obsolete),
+            "pending": self.pending,
+            "tombstones": {name: sorted(ids) for name, ids in self.tombstones.items() if ids},
+            "segments": [
+                dict(s, blooms={name: b.to_dict() for name, b in s["blooms"].items()})
+                for s in self.segments
+            ],
+        }
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _reserve(self, partition, entry):
+        """Allocate a segment name and record it as pending; the caller saves the manifest."""
+        name = f"seg-{self.next_segment:06d}-{partition}.jsonl.gz"
+        self.next_segment += 1
+        self.pending[name] = dict(entry, partition=partition)
+        return name
+
+    def _write_segment(self, name, partition, memories):
+        with open(os.path.join(self.directory, name), "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                for mem in memories:
+                    f.write((json.dumps(mem, ensure_ascii=False) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        return self._summarize(name, partition, memories)
+
+    def _summarize(self, name, partition, memories):
+        blooms = {}
+        for facet in FACETS:
+            values = {v for mem in memories for v in facet_values(mem, facet)}
+            bloom = BloomFilter.for_capacity(len(values))
+            for v in values:
+                bloom.add(v)
+            blooms[facet] = bloom
+        ids = BloomFilter.for_capacity(len(memories))
+        for mem in memories:
+            ids.add(mem["id"])
+        blooms["id"] = ids
+
+        dates = [memory_date(mem) for mem in memories]
+        return {
+            "name": name,
+            "partition": partition,
+            "count": len(memories),
+            "min_date": min(dates),
+            "max_date": max(dates),
+            "blooms": blooms,
+        }
+
+    def _read_segment(self, summary, dead=None):
+        """Yield (line offset, memory, line bytes) for each live record.
+
+        Offsets are stable as segments are immutable. The line bytes are the
+        record's JSON as stored, so responses can reuse them without re-encoding.
+        """
+        if dead is None:
+            dead = self.tombstones.get(summary["name"], ())
+        with gzip.open(os.path.join(self.directory, summary["name"]), "rb") as f:
+            for offset, line in enumerate(f):
+                line = line.rstrip(b"\n")
+                mem = json.loads(line)
+                if mem["id"] not in dead:
+                    yield offset, mem, line
+
+    # --- Readers ---
+    def snapshot(self):
+        """Pin the current segments for reading; close the returned ColdSnapshot when done."""
+        with self._lock:
+            pinned = []
+            for summary in self.segments:
+                self._readers[summary["name"]] = self._readers.get(summary["name"], 0) + 1
+                pinned.append((summary, frozenset(self.tombstones.get(summary["name"], ()))))
+            return ColdSnapshot(self, pinned, self.generation)
+
+    def _unpin(self, names):
+        with self._lock:
+            removed = False
+            for name in names:
+                self._readers[name] -= 1
+                if self._readers[name] == 0:
+                    del self._readers[name]
+                    if name in self.obsolete:
+                        self._remove_obsolete(name)
+                        removed = True
+            if removed:
+                self._save_manifest()
+
+    def _remove_obsolete(self, name):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+        self.obsolete.discard(name)
+
+    # --- Tiering ---
+    def stage_seal(self, memories, horizon_days=HOT_HORIZON_DAYS):
+        """Write the memories older than the horizon into new month segments.
+
+        memories must be copies the caller will not mutate, since the files are
+        written without holding the lock. Returns the staged segments for
+        commit_seal(). In between, the caller persists the hot tier without the
+        sealed records, so a crash at any point leaves every record recoverable.
+        """
+        cutoff = hot_cutoff(horizon_days)
+        partitions = {}
+        for mem in memories:
+            if memory_date(mem) < cutoff:
+                partitions.setdefault(memory_date(mem)[:7] or "undated", []).append(mem)
+        if not partitions:
+            return []
+
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            names = {p: self._reserve(p, {"kind": "seal"}) for p in sorted(partitions)}
+            self._save_manifest()
+        return [
+            (self._write_segment(names[p], p, partitions[p]), {mem["id"] for mem in partitions[p]})
+            for p in sorted(partitions)
+        ]
+
+    def commit_seal(self, staged, sealed_ids):
+        """Register staged segments once the hot tier no longer holds sealed_ids.
+
+        Staged records outside sealed_ids were updated or deleted while the
+        segments were written; they stay hot (or gone) and are tombstoned here.
+        """
+        if not staged:
+            return
+        with self._lock:
+            for summary, ids in staged:
+                self.pending.pop(summary["name"])
+                stale = ids - set(sealed_ids)
+                if stale:
+                    self.tombstones[summary["name"]] = stale
+                self.segments.append(summary)
+            self._save_manifest()
+
+    def _find(self, memory_id):
+        for summary in list(self.segments):
+            if memory_id not in summary["blooms"]["id"]:
+                continue
+            for _, mem, _ in self._read_segment(summary):
+                if mem["id"] == memory_id:
+                    return mem, summary["name"]
+        return None, None
+
+    def locate(self, memory_id):
+        """Return (memory, segment name) for a live cold memory, or (None, None)."""
+        with self._lock:
+            return self._find(memory_id)
+
+    def tombstone(self, segment_name, memory_id):
+        """Mark a record dead in its segment. Callers persist its replacement first."""
+        with self._lock:
+            if segment_name not in {s["name"] for s in self.segments}:
+                # Compacted since the caller located it; the record moved to the replacement
+                segment_name = self._find(memory_id)[1]
+                if segment_name is None:
+                    return
+            self.tombstones.setdefault(segment_name, set()).add(memory_id)
+            self._save_manifest()
+
+    def reconcile(self, hot_ids):
+        """Tombstone cold copies of ids that also live in the hot tier (left by a crash)."""
+        with self._lock:
+            changed = False
+            for summary in self.segments:
+                candidates = {i for i in hot_ids if i in summary["blooms"]["id"]}
+                if not candidates:
+                    continue
+                for _, mem, _ in self._read_segment(summary):
+                    if mem["id"] in candidates:
+                        self.tombstones.setdefault(summary["name"], set()).add(mem["id"])
+                        changed = True
+            if changed:
+                self._save_manifest()
+
+    # --- Compaction ---
+    def plan_compaction(self, target=SEGMENT_TARGET_RECORDS):
+        """Return groups of segment names to rewrite together, one group per month.
+
+        A group holds every segment with tombstones, plus the month's small
+        segments (under half the target) when there are several of them, since
+        each seal pass adds a new segment per month it touches.
+        """
+        with self._lock:
+            by_partition = {}
+            for summary in self.segments:
+                by_partition.setdefault(summary["partition"], []).append(summary)
+
+            groups = []
+            for partition in sorted(by_partition):
+                segments = by_partition[partition]
+                names = {s["name"] for s in segments if self.tombstones.get(s["name"])}
+                small = [s["name"] for s in segments if s["count"] < target // 2]
+                if len(small) > 1:
+                    names.update(small)
+                if names:
+                    groups.append(sorted(names))
+            return groups
+
+    def compact_segments(self, names, target=SEGMENT_TARGET_RECORDS):
+        """Rewrite one group of same-month segments without their dead records.
+
+        The records are read and written without holding the lock, so readers
+        and tombstoning carry on meanwhile; the lock is only taken to plan the
+        output and to swap it in. Returns the number of segments replaced.
+        """
+        with self._lock:
+            group = [s for s in self.segments if s["name"] in names]
+            if len(group) != len(names):
+                return 0
+            dead = {s["name"]: frozenset(self.tombstones.get(s["name"], ())) for s in group}
+            for s in group:
+                self._readers[s["name"]] = self._readers.get(s["name"], 0) + 1
+        try:
+            live = [mem for s in group for _, mem, _ in self._read_segment(s, dead[s["name"]])]
+        finally:
+            self._unpin(names)
+
+        partition = group[0]["partition"]
+        chunks = [live[i:i + target] for i in range(0, len(live), target)]
+        with self._lock:
+            outputs = [self._reserve(partition, {"kind": "compact", "replaces": sorted(names)}) for _ in chunks]
+            self._save_manifest()
+        written = [self._write_segment(name, partition, chunk) for name, chunk in zip(outputs, chunks)]
+
+        with self._lock:
+            for name in outputs:
+                self.pending.pop(name)
+            if not set(names) <= {s["name"] for s in self.segments}:
+                # Another compaction replaced part of the group meanwhile
+                for name in outputs:
+                    os.remove(os.path.join(self.directory, name))
+                self._save_manifest()
+                return 0
+
+            # Records tombstoned while the group was being rewritten are dead in the output too
+            late = set()
+            for name in names:
+                late |= self.tombstones.pop(name, set()) - dead[name]
+            for summary, chunk in zip(written, chunks):
+                ids = {mem["id"] for mem in chunk} & late
+                if ids:
+                    self.tombstones[summary["name"]] = ids
+
+            self.segments = sorted([s for s in self.segments if s["name"] not in names] + written,
+                                   key=lambda s: s["name"])
+            # Replaced files are recorded so a crash before removal cannot resurrect them
+            self.obsolete.update(names)
+            self._save_manifest()
+
+            # Files still pinned by an open snapshot are removed by its close()
+            idle = [name for name in names if name not in self._readers]
+            for name in idle:
+                self._remove_obsolete(name)
+            if idle:
+                self._save_manifest()
+            return len(names)
+
+    def compact(self, target=SEGMENT_TARGET_RECORDS):
+        """Run every planned compaction; returns the number of segments replaced."""
+        return sum(self.compact_segments(names, target) for names in self.plan_compaction(target))
+
+    def stats(self):
+        return {
+            "segments": len(self.segments),
+            "cold_memories": sum(s["count"] for s in self.segments)
+            - sum(len(ids) for ids in self.tombstones.values()),
+        }
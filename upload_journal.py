@@ -1,15 +1,13 @@
 import os
 import json
-from openai import OpenAI
-import pinecone
+from local_index import open_embedding_client, open_index
 
 # Input file – make sure this matches your migrated journal
 INPUT_FILE = "core_memory_api/journal_fixed.jsonl"
 
 # Initialize clients
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-pc = pinecone.Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pc.Index("core-memory")
+client = open_embedding_client()
+index = open_index("core-memory")
 
 def embed_text(text):
     """Generate embeddings safely from OpenAI."""
@@ -46,6 +44,9 @@ def upload_entries():
             meta = entry.get("meta", {})
             metadata = clean_metadata(meta)
             metadata["kind"] = entry.get("kind", "journal")
+            date_digits = str(meta.get("datetime_iso", ""))[:10].replace("-", "")
+            if len(date_digits) == 8 and date_digits.isdigit():
+                metadata["date_num"] = int(date_digits)  # for date range filters
 
             index.upsert([{
                 "id": entry.get("id", meta.get("datetime_iso", "")),